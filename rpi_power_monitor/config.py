@@ -1,14 +1,31 @@
 import logging
-import sys
+import types
+
+from rpi_power_monitor.log_buffer import stdout_handler
 
 # Create basic logger
 logger = logging.getLogger('power_monitor')
 logger.setLevel(logging.INFO)
-ch = logging.StreamHandler(sys.stdout)
-ch.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s : %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-ch.setFormatter(formatter)
-logger.addHandler(ch)
+# Only attach the handler once, even if this module is reloaded or imported under a second name.
+if logger.handlers:
+    ch = logger.handlers[0]
+else:
+    ch = stdout_handler()   # Buffered when stdout isn't a terminal. See log_buffer.py.
+    ch.setLevel(logging.INFO)
+    formatter = logging.Formatter('%(asctime)s : %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+
+def set_log_level(level):
+    """ Sets the level of the power_monitor logger and its console handler together.
+
+    Hot paths should check logger.isEnabledFor(logging.DEBUG) before building expensive debug output. The logger
+    caches the answer, and it stays correct after the level is changed here.
+    """
+    logger.setLevel(level)
+    ch.setLevel(level)
+
 
 # Using a multimeter, measure the voltage of the receptacle where your 9V AC transformer will plug into.
 # Enter the measured value below.
@@ -39,6 +56,10 @@ ADC_CHANNELS = {
     'v_sensor_channel': 5
 }
 
+# SPI clock speed for the MCP3008, in Hz. The MCP3008 is rated for 3.6 MHz at 5V and 1.35 MHz at 2.7V, which works out to
+# about 1.9 MHz at the 3.3V it runs on here, so don't go above that.
+SPI_SPEED_HZ = 1750000
+
 # The values from running the software in "phase" mode should go below!
 CT_PHASE_CORRECTION = {
     'ct1': 1,
@@ -49,6 +70,10 @@ CT_PHASE_CORRECTION = {
     'ct6': 1,
 }
 
+# The SPI clock speed that the phase correction values above were found at. If SPI_SPEED_HZ is changed, run "phase" mode
+# again at the new speed, and set this to that speed along with the new values.
+CT_PHASE_CORRECTION_SPI_HZ = 1750000
+
 # AFTER phase correction is completed, these values are used in the final calibration for accuracy.
 # See the documentation for more information.
 ACCURACY_CALIBRATION = {
@@ -60,3 +85,9 @@ ACCURACY_CALIBRATION = {
     'ct6': 1,
     'AC': 1,
 }
+
+# The settings are read-only once loaded, so every importer can share the same objects.
+db_settings = types.MappingProxyType(db_settings)
+ADC_CHANNELS = types.MappingProxyType(ADC_CHANNELS)
+CT_PHASE_CORRECTION = types.MappingProxyType(CT_PHASE_CORRECTION)
+ACCURACY_CALIBRATION = types.MappingProxyType(ACCURACY_CALIBRATION)
@@ -1,3 +1,4 @@
+import numpy as np
 from influxdb import InfluxDBClient
 from influxdb.exceptions import InfluxDBServerError
 from requests.exceptions import ConnectionError
@@ -148,7 +149,7 @@ def init_db():
         logger.debug("Could not connect to InfluxDB")
         return False
     except Exception:
-        logger.debug(f"Could not connect to {db_settings['host']}:{db_settings['port']}")
+        logger.debug("Could not connect to %s:%s", db_settings['host'], db_settings['port'])
         return False
 
 
@@ -156,78 +157,62 @@ def close_db():
     client.close()
 
 
-def write_to_influx(solar_power_values,
-                    home_load_values,
-                    net_power_values,
-                    ct1_dict,
-                    ct2_dict,
-                    ct3_dict,
-                    ct4_dict,
-                    ct5_dict,
-                    ct6_dict,
-                    poll_time,
-                    length,
-                    voltages):
+def build_points(solar_power_values,
+                 home_load_values,
+                 net_power_values,
+                 ct_values,
+                 poll_time,
+                 length,
+                 voltages):
+    """ Averages the values collected over a polling cycle and returns them as a list of points for write_points().
+
+    The solar, home load, and net values are dictionaries of arrays (or lists), and voltages is an array (or list). Only the first length values of each are used.
+    ct_values is an array of per-CT results as returned by calculate_power(), with one row for each reading. Only the first length rows are used.
+    """
     # Calculate Averages
-    avg_solar_power = sum(solar_power_values['power']) / length
-    avg_solar_current = sum(solar_power_values['current']) / length
-    avg_solar_pf = sum(solar_power_values['pf']) / length
-    avg_home_power = sum(home_load_values['power']) / length
-    avg_home_current = sum(home_load_values['current']) / length
-    avg_net_power = sum(net_power_values['power']) / length
-    avg_net_current = sum(net_power_values['current']) / length
-    ct1_avg_power = sum(ct1_dict['power']) / length
-    ct1_avg_current = sum(ct1_dict['current']) / length
-    ct1_avg_pf = sum(ct1_dict['pf']) / length
-    ct2_avg_power = sum(ct2_dict['power']) / length
-    ct2_avg_current = sum(ct2_dict['current']) / length
-    ct2_avg_pf = sum(ct2_dict['pf']) / length
-    ct3_avg_power = sum(ct3_dict['power']) / length
-    ct3_avg_current = sum(ct3_dict['current']) / length
-    ct3_avg_pf = sum(ct3_dict['pf']) / length
-    ct4_avg_power = sum(ct4_dict['power']) / length
-    ct4_avg_current = sum(ct4_dict['current']) / length
-    ct4_avg_pf = sum(ct4_dict['pf']) / length
-    ct5_avg_power = sum(ct5_dict['power']) / length
-    ct5_avg_current = sum(ct5_dict['current']) / length
-    ct5_avg_pf = sum(ct5_dict['pf']) / length
-    ct6_avg_power = sum(ct6_dict['power']) / length
-    ct6_avg_current = sum(ct6_dict['current']) / length
-    ct6_avg_pf = sum(ct6_dict['pf']) / length
-    avg_voltage = sum(voltages) / length
+    avg_solar_power = float(np.mean(solar_power_values['power'][:length]))
+    avg_solar_current = float(np.mean(solar_power_values['current'][:length]))
+    avg_solar_pf = float(np.mean(solar_power_values['pf'][:length]))
+    avg_home_power = float(np.mean(home_load_values['power'][:length]))
+    avg_home_current = float(np.mean(home_load_values['current'][:length]))
+    avg_net_power = float(np.mean(net_power_values['power'][:length]))
+    avg_net_current = float(np.mean(net_power_values['current'][:length]))
+    ct_values = ct_values[:length]
+    ct_avg_power = ct_values['power'].mean(axis=0)
+    ct_avg_current = ct_values['current'].mean(axis=0)
+    ct_avg_pf = ct_values['pf'].mean(axis=0)
+    avg_voltage = float(np.mean(voltages[:length]))
 
     # Create Points
     home_load = Point('home_load', power=avg_home_power, current=avg_home_current, time=poll_time)
     solar = Point('solar', power=avg_solar_power, current=avg_solar_current, pf=avg_solar_pf, time=poll_time)
     net = Point('net', power=avg_net_power, current=avg_net_current, time=poll_time)
-    ct1 = Point('ct', power=ct1_avg_power, current=ct1_avg_current, pf=ct1_avg_pf, time=poll_time, num=1)
-    ct2 = Point('ct', power=ct2_avg_power, current=ct2_avg_current, pf=ct2_avg_pf, time=poll_time, num=2)
-    ct3 = Point('ct', power=ct3_avg_power, current=ct3_avg_current, pf=ct3_avg_pf, time=poll_time, num=3)
-    ct4 = Point('ct', power=ct4_avg_power, current=ct4_avg_current, pf=ct4_avg_pf, time=poll_time, num=4)
-    ct5 = Point('ct', power=ct5_avg_power, current=ct5_avg_current, pf=ct5_avg_pf, time=poll_time, num=5)
-    ct6 = Point('ct', power=ct6_avg_power, current=ct6_avg_current, pf=ct6_avg_pf, time=poll_time, num=6)
+    cts = [
+        Point('ct', power=float(power), current=float(current), pf=float(pf), time=poll_time, num=num)
+        for num, power, current, pf in zip(range(1, 7), ct_avg_power, ct_avg_current, ct_avg_pf)
+    ]
     v = Point('voltage', voltage=avg_voltage, v_input=0, time=poll_time)
 
     points = [
         home_load.to_dict(),
         solar.to_dict(),
         net.to_dict(),
-        ct1.to_dict(),
-        ct2.to_dict(),
-        ct3.to_dict(),
-        ct4.to_dict(),
-        ct5.to_dict(),
-        ct6.to_dict(),
+        *[ct.to_dict() for ct in cts],
         v.to_dict(),
     ]
+    return points
 
+
+def write_points(points):
+    """ Writes a list of points to InfluxDB. Returns False if the connection to InfluxDB has been lost, otherwise True. """
     try:    
         client.write_points(points, time_precision='ms')
     except InfluxDBServerError as e:
         logger.critical(f"Failed to write data to Influx. Reason: {e}")
     except ConnectionError:
         logger.info("Connection to InfluxDB lost. Please investigate!")
-        quit()
+        return False
+    return True
 
 
 if __name__ == '__main__':
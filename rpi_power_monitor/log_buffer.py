@@ -0,0 +1,60 @@
+import logging
+import os
+import sys
+import threading
+
+
+class BufferedStreamHandler(logging.StreamHandler):
+    """ StreamHandler that leaves log records in the stream's write buffer instead of flushing after every record.
+
+    The buffer is flushed by a background thread every <flush_interval> seconds, whenever a record of level ERROR
+    or higher is emitted, and at interpreter exit (logging.shutdown() flushes all handlers).
+    The records are written through the stream itself, ie, sys.stdout, so they stay in order with print() output.
+    The flusher thread is only started when the first record is emitted.
+    """
+    def __init__(self, stream=None, flush_interval=1.0):
+        if stream is None:
+            stream = sys.stdout
+        super().__init__(stream)
+        self._flush_interval = flush_interval
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def _flush_periodically(self):
+        while not self._stop.wait(self._flush_interval):
+            self.flush()
+
+    def _start_flusher(self):
+        with self.lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+                self._flusher.start()
+
+    def emit(self, record):
+        try:
+            if self._flusher is None:
+                self._start_flusher()
+            msg = self.format(record)
+            with self.lock:
+                self.stream.write(msg + self.terminator)
+            if record.levelno >= logging.ERROR:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        super().close()
+
+
+def stdout_handler():
+    """ Returns the handler that writes the power_monitor log to stdout.
+
+    Log lines are only buffered when stdout is redirected (ie, when running as a service). Interactive sessions, or any
+    session with RPI_LOG_UNBUFFERED set in the environment, write each line immediately so that log messages aren't
+    printed out of order with the input() prompts.
+    """
+    if sys.stdout.isatty() or os.environ.get('RPI_LOG_UNBUFFERED'):
+        return logging.StreamHandler(sys.stdout)
+    return BufferedStreamHandler(sys.stdout)
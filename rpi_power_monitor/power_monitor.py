@@ -1,9 +1,13 @@
 #!/usr/bin/python
 import csv
+import functools
 import logging
 import os
 import pickle
+import queue
+import signal
 import sys
+import threading
 import timeit
 from datetime import datetime
 from math import sqrt
@@ -14,6 +18,7 @@ from socket import socket
 from textwrap import dedent
 from time import sleep
 
+import numpy as np
 import spidev
 from prettytable import PrettyTable
 
@@ -22,10 +27,235 @@ from rpi_power_monitor.config import ACCURACY_CALIBRATION
 from rpi_power_monitor.config import AC_TRANSFORMER_OUTPUT_VOLTAGE
 from rpi_power_monitor.config import ADC_CHANNELS
 from rpi_power_monitor.config import CT_PHASE_CORRECTION
+from rpi_power_monitor.config import CT_PHASE_CORRECTION_SPI_HZ
 from rpi_power_monitor.config import GRID_VOLTAGE
+from rpi_power_monitor.config import SPI_SPEED_HZ
 from rpi_power_monitor.config import db_settings
 from rpi_power_monitor.config import logger
-from rpi_power_monitor.plotting import plot_data
+from rpi_power_monitor.config import set_log_level
+
+
+# calculate_power() returns one record of this type per CT.
+RESULT_DTYPE = np.dtype([('power', 'f8'), ('current', 'f8'), ('voltage', 'f8'), ('pf', 'f8')])
+
+# The number of samples _power_sums() reduces at a time. The float64 copies of a tile of 6 channels take 192 KB, which stays
+# within the Pi 4's 1 MB L2 cache.
+_TILE = 2048
+
+# The number of times find_phasecal() moves its coarse grid (by half its width each time) to look for a PF peak beyond the grid's
+# edge. This stretches the search range from 0.5 - 1.5 to -1.5 - 3.5.
+_MAX_GRID_MOVES = 4
+
+# How long run_main() waits, in seconds, for the InfluxDB writer thread to send the readings still queued when it shuts down.
+_WRITER_SHUTDOWN_TIMEOUT = 5
+
+# The fixed-width layout of print_results()' table
+_RESULTS_ROW = "{:>8}" + " {:>10.3f}" * 6
+_RESULTS_HEADER = f"{'':>8}" + "".join(f" {f'ct{ct}':>10}" for ct in range(1, 7))
+
+
+def _power_sums(ct, v):
+    """ Reduces the current and phase-corrected voltage samples of each channel to the sums needed to calculate power.
+
+    Arguments:
+    ct -- array, the current samples with one row per channel
+    v  -- array, the phase-corrected voltage samples with one row per channel, the same shape as ct
+
+    Returns a (channels, 5) array. The columns are: the sum of the current samples, the sum of the voltage samples,
+    the sum of the squared current samples, the sum of the squared voltage samples, and the sum of current * voltage.
+    Each row's samples are first shifted by that row's first sample, which leaves the (co)variances calculated from the
+    sums unchanged.
+    """
+    # Work on contiguous float64 copies of the samples so that every reduction below runs NumPy's vectorized (SSE/NEON)
+    # float64 kernels instead of casting the int16/float32 samples separately for each one. Accumulating in float64 also
+    # keeps the sums of squares exact for the current samples, since they are whole numbers far below 2**53.
+    # Long batches are copied and reduced one tile of samples at a time, so that the copies stay in cache while all five
+    # sums are taken from them. A default 2000 sample batch is a single tile.
+    # The samples are centred on their first sample, which is close enough to their mean that N * sum(x * x) - sum(x) ** 2
+    # no longer cancels most of its digits away. This matters for the fractional phase-corrected voltage samples, whose sums
+    # of squares aren't exact. Unlike np.std(), it keeps to a single pass over the samples.
+    sums = np.zeros((ct.shape[0], 5))
+    ct_shift = ct[:, :1].astype(np.float64)
+    v_shift = v[:, :1].astype(np.float64)
+    for start in range(0, ct.shape[1], _TILE):
+        ct_tile = np.subtract(ct[:, start:start + _TILE], ct_shift, dtype=np.float64)
+        v_tile = np.subtract(v[:, start:start + _TILE], v_shift, dtype=np.float64)
+        sums[:, 0] += ct_tile.sum(axis=1)
+        sums[:, 1] += v_tile.sum(axis=1)
+        sums[:, 2] += np.einsum('ij,ij->i', ct_tile, ct_tile)
+        sums[:, 3] += np.einsum('ij,ij->i', v_tile, v_tile)
+        sums[:, 4] += np.einsum('ij,ij->i', ct_tile, v_tile)
+    return sums
+
+
+def _fused_comoments(raw, phasecal):
+    """ Reduces the raw samples of each channel to the (co)variances needed to calculate power, applying the phase correction on the fly so that
+    the phase-corrected voltage waves built by rebuild_waves() never have to be stored.
+
+    Arguments:
+    raw      -- array, the (7, N) samples from collect_data(), with rows 0 - 5 holding ct1 - ct6 and row 6 holding the voltage.
+    phasecal -- sequence, the phase correction constant for each of ct1 - ct6
+
+    Returns a (6, 3) array. With v being the channel's phase-corrected voltage wave, the columns are N * sum(ct * ct) - sum(ct) ** 2,
+    N * sum(v * v) - sum(v) ** 2, and N * sum(ct * v) - sum(ct) * sum(v), ie, N ** 2 times the variances of the current and voltage and their covariance.
+    """
+    # Every point of a rebuilt wave is (1 - PHASECAL) * a + PHASECAL * b, where a is the previous voltage sample and b the current one
+    # (both are the first voltage sample for the first point). The wave's (co)variances are therefore mixes of those of a and b, which all
+    # channels share. Everything summed here is a product of 10-bit samples, so the sums are whole numbers. They're taken by float64 BLAS
+    # calls, which are exact for whole numbers below 2 ** 53, and finished in int64, which holds them for batches of up to about 2.9 million
+    # samples. This way the variances have no rounding error to cancel, and the phase correction is only applied to the final, already
+    # centred, values.
+    channels = raw.shape[0] - 1
+    num_samples = raw.shape[1]
+    a_row = channels        # The rows of the matrix x below: the CT samples, then a, then b.
+    b_row = channels + 1
+
+    # The first point of every channel
+    x_0 = np.empty(channels + 2)
+    x_0[:channels] = raw[:-1, 0]
+    x_0[a_row] = x_0[b_row] = raw[-1, 0]
+    sums = x_0.copy()
+    gram = np.outer(x_0, x_0)   # The sums of the products of every pair of rows
+
+    # The tiles are copied into one float64 buffer which is reused for every tile, so no temporaries are allocated inside the loop.
+    buffer = np.empty((channels + 2, min(_TILE, max(num_samples - 1, 0))))
+    for start in range(0, num_samples - 1, _TILE):
+        # Each tile overlaps the next by one sample, which is the previous voltage sample for the first point of the next tile.
+        tile = raw[:, start:start + _TILE + 1]
+        x = buffer[:, :tile.shape[1] - 1]
+        x[:channels] = tile[:-1, 1:]
+        x[a_row] = tile[-1, :-1]
+        x[b_row] = tile[-1, 1:]
+        sums += x.sum(axis=1)
+        gram += x @ x.T     # One matrix multiply takes all of the products at once.
+
+    sums = sums.astype(np.int64)
+    gram = gram.astype(np.int64)
+    sum_ct = sums[:channels]
+    sum_a = int(sums[a_row])
+    sum_b = int(sums[b_row])
+    sum_ct_ct = gram.diagonal()[:channels]
+    sum_ct_a = gram[:channels, a_row]
+    sum_ct_b = gram[:channels, b_row]
+    sum_a_a = int(gram[a_row, a_row])
+    sum_b_b = int(gram[b_row, b_row])
+    sum_a_b = int(gram[a_row, b_row])
+
+    sums = (sum_ct, sum_a, sum_b, sum_ct_ct, sum_ct_a, sum_ct_b, sum_a_a, sum_b_b, sum_a_b)
+    return np.column_stack(_comoments(num_samples, sums, np.asarray(phasecal, dtype=np.float64)))
+
+
+def _comoments(n, sums, phasecal):
+    """ Combines the sums taken by _fused_comoments() or _phase_kernel() into the (co)variances of the current and the phase-corrected voltage.
+
+    Arguments:
+    n        -- int, the number of samples
+    sums     -- tuple, sum(ct), sum(a), sum(b), sum(ct * ct), sum(ct * a), sum(ct * b), sum(a * a), sum(b * b), and sum(a * b), where a and b are the
+                previous and current voltage samples of each point. Each can be a single value or an array with one entry per channel.
+    phasecal -- float or array, the phase correction constant(s)
+
+    Returns N * sum(ct * ct) - sum(ct) ** 2, N * sum(v * v) - sum(v) ** 2, and N * sum(ct * v) - sum(ct) * sum(v), where v is the phase-corrected wave.
+    """
+    sum_ct, sum_a, sum_b, sum_ct_ct, sum_ct_a, sum_ct_b, sum_a_a, sum_b_b, sum_a_b = sums
+    p = phasecal
+    q = 1.0 - p
+    current_comoment = n * sum_ct_ct - sum_ct * sum_ct
+    voltage_comoment = (q * q * (n * sum_a_a - sum_a * sum_a) + 2 * p * q * (n * sum_a_b - sum_a * sum_b)
+                        + p * p * (n * sum_b_b - sum_b * sum_b))
+    power_comoment = q * (n * sum_ct_a - sum_ct * sum_a) + p * (n * sum_ct_b - sum_ct * sum_b)
+    return current_comoment, voltage_comoment, power_comoment
+
+
+def _phase_kernel(ct, v, phasecal):
+    """ Reduces a single channel's current samples and raw voltage samples to the (co)variances needed to check a PHASECAL constant,
+    applying the phase correction on the fly instead of building the wave with rebuild_wave(). See _fused_comoments() for more info.
+
+    Arguments:
+    ct       -- array or list, raw ADC output values for a single CT, ie, one of the int16 arrays from collect_data()
+    v        -- array or list, raw ADC readings from the original voltage waveform, ie, collect_data()'s 'voltage' array
+    phasecal -- float, the phase correction constant to check
+
+    Returns the channel's N * sum(ct * ct) - sum(ct) ** 2, N * sum(v * v) - sum(v) ** 2, and N * sum(ct * v) - sum(ct) * sum(v), where v is the phase-corrected wave.
+    """
+    # This is _fused_comoments() for one channel. A single channel's samples fit in cache, so there's no need to work in tiles,
+    # and the sums are small enough to finish in exact Python integers.
+    # The int16 samples from collect_data() are widened once, in a single conversion, to float64 so that the dot products below run
+    # on BLAS. The sums are whole numbers far below 2 ** 53, so they come out exact.
+    ct = np.asarray(ct, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    n = len(v)
+    ct_0 = int(ct[0])
+    v_0 = int(v[0])
+    a = v[:-1]      # The previous voltage sample for each point after the first
+    b = v[1:]       # The current voltage sample for each point after the first
+
+    # Sums over every point, with the first point's previous and current samples both being the first voltage sample.
+    sum_ct = int(ct.sum())
+    sum_ct_ct = int(ct @ ct)
+    sum_ct_a = int(ct[1:] @ a) + ct_0 * v_0
+    sum_ct_b = int(ct[1:] @ b) + ct_0 * v_0
+    sum_b = int(v.sum())
+    sum_a = sum_b - int(v[-1]) + v_0
+    sum_b_b = int(v @ v)
+    sum_a_a = sum_b_b - int(v[-1]) ** 2 + v_0 * v_0
+    sum_a_b = int(a @ b) + v_0 * v_0
+
+    return _comoments(n, (sum_ct, sum_a, sum_b, sum_ct_ct, sum_ct_a, sum_ct_b, sum_a_a, sum_b_b, sum_a_b), phasecal)
+
+
+def _phasecal_pfs(ct, v, phasecals):
+    """ Calculates a single channel's power factor for each of an array of PHASECAL constants, for find_phasecal()'s search.
+
+    Arguments:
+    ct        -- array, raw ADC output values for a single CT, ie, one of the int16 arrays from collect_data()
+    v         -- array, raw ADC readings from the original voltage waveform, ie, collect_data()'s 'voltage' array
+    phasecals -- array, the phase correction constants to try
+
+    Returns an array of the power factors, with 0 where the PF is undefined.
+    """
+    # _phase_kernel() works for a whole array of PHASECAL values at once, and the scaling factors cancel out of the PF.
+    current_comoment, voltage_comoment, power_comoment = _phase_kernel(ct, v, phasecals)
+    apparent_comoment = np.sqrt(current_comoment * np.maximum(0.0, voltage_comoment))
+    return np.divide(power_comoment, apparent_comoment, out=np.zeros(len(phasecals)), where=apparent_comoment > 0)
+
+
+def _phasecal_results(current_comoment, voltage_comoment, power_comoment, num_samples, ct_scaling_factor, voltage_scaling_factor):
+    """ Scales a single channel's (co)variances, as returned by _phase_kernel(), into check_phasecal()'s results. """
+    real_power = power_comoment / (num_samples * num_samples) * ct_scaling_factor * voltage_scaling_factor
+    rms_current = sqrt(max(0, current_comoment)) / num_samples * ct_scaling_factor
+    rms_voltage = sqrt(max(0, voltage_comoment)) / num_samples * voltage_scaling_factor
+
+    apparent_power = rms_voltage * rms_current
+
+    try:
+        power_factor = real_power / apparent_power
+    except ZeroDivisionError:
+        power_factor = 0
+
+    results = {
+        'power': real_power,
+        'current': rms_current,
+        'voltage': rms_voltage,
+        'pf': power_factor
+    }
+
+    return results
+
+
+@functools.lru_cache(maxsize=1)
+def _get_ip():
+    """ Looks up the local IP address for RPiPowerMonitor.get_ip(). The address rarely changes while the program is running, so it's
+    only looked up once instead of opening a new socket on every call.
+    """
+    s = socket(AF_INET, SOCK_DGRAM)
+    try:
+        s.connect(('10.255.255.255', 1))
+        ip = s.getsockname()[0]
+    except:
+        ip = None
+    finally:
+        s.close()
+    return ip
 
 
 class RPiPowerMonitor:
@@ -35,102 +265,135 @@ class RPiPowerMonitor:
                  grid_voltage=GRID_VOLTAGE,
                  ac_transformer_output_voltage=AC_TRANSFORMER_OUTPUT_VOLTAGE,
                  ct_phase_correction=CT_PHASE_CORRECTION,
+                 ct_phase_correction_spi_hz=CT_PHASE_CORRECTION_SPI_HZ,
                  accuracy_calibration=ACCURACY_CALIBRATION,
-                 adc_channels=ADC_CHANNELS
+                 adc_channels=ADC_CHANNELS,
+                 spi_speed_hz=SPI_SPEED_HZ
                  ):
         self.grid_voltage = grid_voltage
         self.ac_transformer_output_voltage = ac_transformer_output_voltage
         self.ct_phase_correction = ct_phase_correction
+        self.ct_phase_correction_spi_hz = ct_phase_correction_spi_hz
         self.accuracy_calibration = accuracy_calibration
         self.adc_channels = adc_channels
+        self.spi_speed_hz = spi_speed_hz
+
+        # The order that collect_data() reads the channels in. Changing it changes the delay between each CT's sample and the
+        # voltage sample, and with it the phasecal values in config.py.
+        self._read_order = ('ct1', 'ct5', 'ct2', 'voltage', 'ct3', 'ct4', 'ct6')
+        adc_keys = {name: f'{name}_channel' for name in self._read_order}
+        adc_keys['voltage'] = 'v_sensor_channel'
+        # MCP3008 command frames (start bit, single-ended mode + channel number, padding) for each of the 8 channels, and
+        # collect_data()'s frames in read order. These are tuples because xfer2() writes the reply back into list arguments.
+        self._adc_frames = tuple((1, (8 + adc_num) << 4, 0) for adc_num in range(8))
+        self._read_frames = tuple(self._adc_frames[adc_channels[adc_keys[name]]] for name in self._read_order)
+
+        # collect_data() writes each channel into a row of this buffer: rows 0 - 5 are ct1 - ct6 and row 6 is the voltage.
+        self._raw = None
+        rows = ('ct1', 'ct2', 'ct3', 'ct4', 'ct5', 'ct6', 'voltage')
+        self._read_rows = [rows.index(name) for name in self._read_order]
+
+        # Per-CT settings ordered by CT number.
+        # Most of each phase correction value comes from the order the channels are read in, which is a fixed number of transfers
+        # whatever the SPI clock, so the values aren't rescaled when the clock changes. They may still be off at a new clock though.
+        self._phasecal = tuple(ct_phase_correction[f'ct{n}'] for n in range(1, 7))
+        if spi_speed_hz != ct_phase_correction_spi_hz:
+            logger.info(
+                f"The SPI clock is set to {spi_speed_hz} Hz, but the phase correction values were found at {ct_phase_correction_spi_hz} Hz. "
+                "For the best accuracy, please run the software in 'phase' mode again at this speed, and then set "
+                f"CT_PHASE_CORRECTION_SPI_HZ to {spi_speed_hz} in config.py when you update ct_phase_correction.")
+
+        # The calibration part of each scaling factor doesn't change while running, so calculate_power() only has to multiply these by vref.
+        self._ct_scale = np.array([100 * accuracy_calibration[f'ct{n}'] for n in range(1, 7)])
+        ac_voltage_ratio = (grid_voltage / ac_transformer_output_voltage) * 11  # Rough approximation
+        self._v_scale = ac_voltage_ratio * accuracy_calibration['AC']
+        self._power_scale = self._ct_scale * self._v_scale
 
         if spi:
             self.spi = spi
         else:
             self.spi = spidev.SpiDev()  # Create SPI
             self.spi.open(0, 0)
-            self.spi.max_speed_hz = 1750000  # Changing this value will require you to adjust the phasecal values in config.py.
+            self.spi.max_speed_hz = spi_speed_hz  # See SPI_SPEED_HZ in config.py.
 
     def dump_data(self, dump_type, samples):
         """ Writes raw data to a CSV file titled 'data-dump-<current_time>.csv' """
         speed_kHz = self.spi.max_speed_hz / 1000
         now = datetime.now().strftime('%m-%d-%Y-%H-%M')
         filename = f'data-dump-{now}.csv'
-        with open(filename, 'w') as f:
+        with open(filename, 'w', newline='', buffering=1 << 16) as f:
             headers = ["Sample#", "ct1", "ct2", "ct3", "ct4", "ct5", "ct6", "voltage"]
             writer = csv.writer(f)
             writer.writerow(headers)
-            # samples contains lists for each data sample.
-            for i in range(0, len(samples[0])):
-                ct1_data = samples[0]
-                ct2_data = samples[1]
-                ct3_data = samples[2]
-                ct4_data = samples[3]
-                ct5_data = samples[4]
-                ct6_data = samples[5]
-                v_data = samples[-1]
-                writer.writerow([i, ct1_data[i], ct2_data[i], ct3_data[i], ct4_data[i], ct5_data[i], ct6_data[i], v_data[i]])
+            # samples contains a sequence of sample data for each channel: ct1 - ct6 first, and the voltage last.
+            # The rows are built by zip() and written in one call, rather than one writerow() per sample.
+            writer.writerows(zip(range(len(samples[0])), *samples[:6], samples[-1]))
         logger.info(f"CSV written to {filename}.")
 
     def get_board_voltage(self):
         """ Take 10 sample readings and return the average board voltage from the +3.3V rail. """
-        samples = []
-        while len(samples) <= 10:
-            data = self.read_adc(self.adc_channels['board_voltage_channel'])
-            samples.append(data)
+        channel = self.adc_channels['board_voltage_channel']
+        total = 0
+        for _ in range(10):
+            total += self.read_adc(channel)
 
-        avg_reading = sum(samples) / len(samples)
+        avg_reading = total / 10
         board_voltage = (avg_reading / 1024) * 3.31 * 2
         return board_voltage
 
     def read_adc(self, adc_num):
         """ Read SPI data from the MCP3008, 8 channels in total. """
-        r = self.spi.xfer2([1, 8 + adc_num << 4, 0])
-        data = ((r[1] & 3) << 8) + r[2]
-        return data
+        r = self.spi.xfer2(self._adc_frames[adc_num])
+        return ((r[1] & 3) << 8) | r[2]
 
-    def collect_data(self, num_samples):
-        """  Takes <num_samples> readings from the ADC for each ADC channel and returns a dictionary containing the CT channel number as the key, and a list of that channel's sample data.
+    def collect_data(self, num_samples, buffer=None):
+        """  Takes <num_samples> readings from the ADC for each ADC channel and returns a dictionary containing the CT channel number as the key, and an array of that channel's sample data.
         
         Arguments:
         num_samples -- int, the number of samples to collect for each channel.
+        buffer      -- array, optional (7, num_samples) int16 array to store the samples in instead of the internal buffer.
 
-        Returns a dictionary where the keys are ct1 - ct6, voltage, and time, and the value of each key is a list of that channel's samples (except for 'time', which is a UTC datetime)
+        Returns a dictionary where the keys are ct1 - ct6, voltage, and time, and the value of each key is an int16 array of that channel's samples (except for 'time', which is a UTC datetime)
+        The 'raw' key holds all of the channels as a single (7, num_samples) array, with rows 0 - 5 holding ct1 - ct6 and row 6 holding the voltage.
+        Unless <buffer> is given, the arrays share a buffer that is overwritten by the next call, so copy them if they need to be kept longer than that.
         """
         now = datetime.utcnow()  # Get time of reading
 
-        ct1_data = []
-        ct2_data = []
-        ct3_data = []
-        ct4_data = []
-        ct5_data = []
-        ct6_data = []
-        v_data = []
-
+        # The MCP3008 only starts a conversion on the falling edge of CS, so every reading needs its own xfer2() transaction.
+        # The reply bytes are staged in a bytearray, which stores them unboxed, and decoded for all channels at once afterwards.
+        # The loop below runs 14000 times per batch, so the frames and methods it uses are looked up once beforehand.
+        replies = bytearray()
+        extend = replies.extend
+        xfer2 = self.spi.xfer2
+        frame_1, frame_2, frame_3, frame_4, frame_5, frame_6, frame_7 = self._read_frames   # In self._read_order
         for _ in range(num_samples):
-            ct1 = self.read_adc(self.adc_channels['ct1_channel'])
-            ct5 = self.read_adc(self.adc_channels['ct5_channel'])
-            ct2 = self.read_adc(self.adc_channels['ct2_channel'])
-            v = self.read_adc(self.adc_channels['v_sensor_channel'])
-            ct3 = self.read_adc(self.adc_channels['ct3_channel'])
-            ct4 = self.read_adc(self.adc_channels['ct4_channel'])
-            ct6 = self.read_adc(self.adc_channels['ct6_channel'])
-            ct1_data.append(ct1)
-            ct2_data.append(ct2)
-            ct3_data.append(ct3)
-            ct4_data.append(ct4)
-            ct5_data.append(ct5)
-            ct6_data.append(ct6)
-            v_data.append(v)
+            extend(xfer2(frame_1))
+            extend(xfer2(frame_2))
+            extend(xfer2(frame_3))
+            extend(xfer2(frame_4))
+            extend(xfer2(frame_5))
+            extend(xfer2(frame_6))
+            extend(xfer2(frame_7))
+
+        if buffer is not None:
+            raw = buffer
+        else:
+            if self._raw is None or self._raw.shape[1] != num_samples:
+                self._raw = np.empty((7, num_samples), dtype=np.int16)
+            raw = self._raw
+
+        replies = np.frombuffer(replies, dtype=np.uint8).reshape(num_samples, len(self._read_frames), 3)
+        raw[self._read_rows] = (((replies[:, :, 1] & 3).astype(np.int16) << 8) | replies[:, :, 2]).T
 
         samples = {
-            'ct1': ct1_data,
-            'ct2': ct2_data,
-            'ct3': ct3_data,
-            'ct4': ct4_data,
-            'ct5': ct5_data,
-            'ct6': ct6_data,
-            'voltage': v_data,
+            'ct1': raw[0],
+            'ct2': raw[1],
+            'ct3': raw[2],
+            'ct4': raw[3],
+            'ct5': raw[4],
+            'ct6': raw[5],
+            'voltage': raw[6],
+            'raw': raw,
             'time': now,
         }
         return samples
@@ -139,275 +402,73 @@ class RPiPowerMonitor:
         """ Calculates amperage, real power, power factor, and voltage
         
         Arguments:
-        samples -- dict, a dictionary containing lists of each channel's sample data, and a tailored voltage wave that's been phase corrected for each corresponding channel. See rebuild_waves() for more info.
-
-        Returns a dictionary containing a dictionary for each channel, with the following structure:
-        {
-            'ct1': {
-                'type': 'consumption',
-                'power': <Real Power (float) for this channel>,
-                'current': <RMS Current (float) for this channel>,
-                'voltage': <RMS Voltage (float)>,
-                'pf': <Power Factor (float) for this channel>
-            },
-            ... ,
-            'ct6' : { ... }
-        }
+        samples       -- dict, holds 'ct', the current samples, and 'v', the voltage wave phase corrected for each channel, as (6, N) arrays with one row per CT. See rebuild_waves() for more info.
+        board_voltage -- float, current reading of the reference voltage from the +3.3V rail
+
+        Returns an array of 6 RESULT_DTYPE records, one per channel (results[0] is ct1), with the following fields:
+            'power'   -- Real Power (float) for this channel
+            'current' -- RMS Current (float) for this channel
+            'voltage' -- RMS Voltage (float) as seen by this channel
+            'pf'      -- Power Factor (float) for this channel
+        A single field can be read for all channels at once, ie, results['power'], or for a single channel, ie, results[0]['power'].
+        """
+        ct = samples['ct']      # current samples, one row per CT
+        v = samples['v']        # phase-corrected voltage waves, one row per CT
+        num_samples = ct.shape[1]
+
+        # Reduce each channel's samples to its sums, and those to N ** 2 times the variances of current and voltage and their covariance.
+        sum_raw_current, sum_raw_voltage, sum_squared_current, sum_squared_voltage, sum_inst_power = _power_sums(ct, v).T
+        comoments = np.column_stack((
+            num_samples * sum_squared_current - sum_raw_current * sum_raw_current,
+            num_samples * sum_squared_voltage - sum_raw_voltage * sum_raw_voltage,
+            num_samples * sum_inst_power - sum_raw_current * sum_raw_voltage,
+        ))
+        return self._results_from_comoments(comoments, num_samples, board_voltage)
+
+    def calculate_power_fast(self, samples, board_voltage, phasecal=None):
+        """ Calculates the same results as calculate_power(), but straight from the samples returned by collect_data(), without rebuild_waves().
+        The phase correction is folded into the sums instead, which saves building the six phase-corrected voltage waves,
+        and the sums are taken exactly in integer arithmetic.
+
+        Arguments:
+        samples       -- dict, the samples returned by collect_data()
+        board_voltage -- float, current reading of the reference voltage from the +3.3V rail
+        phasecal      -- sequence, optional phase correction constants for ct1 - ct6. Defaults to the ct_phase_correction values.
+
+        Returns the same array of RESULT_DTYPE records as calculate_power().
         """
-        ct1_samples = samples['ct1']        # current samples for ct1
-        ct2_samples = samples['ct2']        # current samples for ct2
-        ct3_samples = samples['ct3']        # current samples for ct3
-        ct4_samples = samples['ct4']        # current samples for ct4
-        ct5_samples = samples['ct5']        # current samples for ct5
-        ct6_samples = samples['ct6']        # current samples for ct6
-        v_samples_1 = samples['v_ct1']      # phase-corrected voltage wave specifically for ct1
-        v_samples_2 = samples['v_ct2']      # phase-corrected voltage wave specifically for ct2
-        v_samples_3 = samples['v_ct3']      # phase-corrected voltage wave specifically for ct3
-        v_samples_4 = samples['v_ct4']      # phase-corrected voltage wave specifically for ct4
-        v_samples_5 = samples['v_ct5']      # phase-corrected voltage wave specifically for ct5
-        v_samples_6 = samples['v_ct6']      # phase-corrected voltage wave specifically for ct6
-
-        # Variable Initialization
-        sum_inst_power_ct1 = 0
-        sum_inst_power_ct2 = 0
-        sum_inst_power_ct3 = 0
-        sum_inst_power_ct4 = 0
-        sum_inst_power_ct5 = 0
-        sum_inst_power_ct6 = 0
-        sum_squared_current_ct1 = 0
-        sum_squared_current_ct2 = 0
-        sum_squared_current_ct3 = 0
-        sum_squared_current_ct4 = 0
-        sum_squared_current_ct5 = 0
-        sum_squared_current_ct6 = 0
-        sum_raw_current_ct1 = 0
-        sum_raw_current_ct2 = 0
-        sum_raw_current_ct3 = 0
-        sum_raw_current_ct4 = 0
-        sum_raw_current_ct5 = 0
-        sum_raw_current_ct6 = 0
-        sum_squared_voltage_1 = 0
-        sum_squared_voltage_2 = 0
-        sum_squared_voltage_3 = 0
-        sum_squared_voltage_4 = 0
-        sum_squared_voltage_5 = 0
-        sum_squared_voltage_6 = 0
-        sum_raw_voltage_1 = 0
-        sum_raw_voltage_2 = 0
-        sum_raw_voltage_3 = 0
-        sum_raw_voltage_4 = 0
-        sum_raw_voltage_5 = 0
-        sum_raw_voltage_6 = 0
+        if phasecal is None:
+            phasecal = self._phasecal
+        raw = samples['raw']
+        return self._results_from_comoments(_fused_comoments(raw, phasecal), raw.shape[1], board_voltage)
+
+    def _results_from_comoments(self, comoments, num_samples, board_voltage):
+        """ Turns the (6, 3) array of N ** 2 times the variances and covariance from calculate_power() or _fused_comoments() into calculate_power()'s results. """
+        # Every one of these is an array with one entry per CT.
+        current_comoment, voltage_comoment, power_comoment = comoments.T
 
         # Scaling factors
         vref = board_voltage / 1024
-        ct1_scaling_factor = vref * 100 * self.accuracy_calibration['ct1']
-        ct2_scaling_factor = vref * 100 * self.accuracy_calibration['ct2']
-        ct3_scaling_factor = vref * 100 * self.accuracy_calibration['ct3']
-        ct4_scaling_factor = vref * 100 * self.accuracy_calibration['ct4']
-        ct5_scaling_factor = vref * 100 * self.accuracy_calibration['ct5']
-        ct6_scaling_factor = vref * 100 * self.accuracy_calibration['ct6']
-        ac_voltage_ratio = (self.grid_voltage / self.ac_transformer_output_voltage) * 11  # Rough approximation
-        voltage_scaling_factor = vref * ac_voltage_ratio * self.accuracy_calibration['AC']
-
-        num_samples = len(v_samples_1)
-
-        for i in range(0, num_samples):
-            ct1 = (int(ct1_samples[i]))
-            ct2 = (int(ct2_samples[i]))
-            ct3 = (int(ct3_samples[i]))
-            ct4 = (int(ct4_samples[i]))
-            ct5 = (int(ct5_samples[i]))
-            ct6 = (int(ct6_samples[i]))
-            voltage_1 = (int(v_samples_1[i]))
-            voltage_2 = (int(v_samples_2[i]))
-            voltage_3 = (int(v_samples_3[i]))
-            voltage_4 = (int(v_samples_4[i]))
-            voltage_5 = (int(v_samples_5[i]))
-            voltage_6 = (int(v_samples_6[i]))
-
-            # Process all data in a single function to reduce runtime complexity
-            # Get the sum of all current samples individually
-            sum_raw_current_ct1 += ct1
-            sum_raw_current_ct2 += ct2
-            sum_raw_current_ct3 += ct3
-            sum_raw_current_ct4 += ct4
-            sum_raw_current_ct5 += ct5
-            sum_raw_current_ct6 += ct6
-            sum_raw_voltage_1 += voltage_1
-            sum_raw_voltage_2 += voltage_2
-            sum_raw_voltage_3 += voltage_3
-            sum_raw_voltage_4 += voltage_4
-            sum_raw_voltage_5 += voltage_5
-            sum_raw_voltage_6 += voltage_6
-
-            # Calculate instant power for each ct sensor
-            inst_power_ct1 = ct1 * voltage_1
-            inst_power_ct2 = ct2 * voltage_2
-            inst_power_ct3 = ct3 * voltage_3
-            inst_power_ct4 = ct4 * voltage_4
-            inst_power_ct5 = ct5 * voltage_5
-            inst_power_ct6 = ct6 * voltage_6
-            sum_inst_power_ct1 += inst_power_ct1
-            sum_inst_power_ct2 += inst_power_ct2
-            sum_inst_power_ct3 += inst_power_ct3
-            sum_inst_power_ct4 += inst_power_ct4
-            sum_inst_power_ct5 += inst_power_ct5
-            sum_inst_power_ct6 += inst_power_ct6
-
-            # Squared voltage
-            squared_voltage_1 = voltage_1 * voltage_1
-            squared_voltage_2 = voltage_2 * voltage_2
-            squared_voltage_3 = voltage_3 * voltage_3
-            squared_voltage_4 = voltage_4 * voltage_4
-            squared_voltage_5 = voltage_5 * voltage_5
-            squared_voltage_6 = voltage_6 * voltage_6
-            sum_squared_voltage_1 += squared_voltage_1
-            sum_squared_voltage_2 += squared_voltage_2
-            sum_squared_voltage_3 += squared_voltage_3
-            sum_squared_voltage_4 += squared_voltage_4
-            sum_squared_voltage_5 += squared_voltage_5
-            sum_squared_voltage_6 += squared_voltage_6
-
-            # Squared current
-            sq_ct1 = ct1 * ct1
-            sq_ct2 = ct2 * ct2
-            sq_ct3 = ct3 * ct3
-            sq_ct4 = ct4 * ct4
-            sq_ct5 = ct5 * ct5
-            sq_ct6 = ct6 * ct6
-
-            sum_squared_current_ct1 += sq_ct1
-            sum_squared_current_ct2 += sq_ct2
-            sum_squared_current_ct3 += sq_ct3
-            sum_squared_current_ct4 += sq_ct4
-            sum_squared_current_ct5 += sq_ct5
-            sum_squared_current_ct6 += sq_ct6
-
-        avg_raw_current_ct1 = sum_raw_current_ct1 / num_samples
-        avg_raw_current_ct2 = sum_raw_current_ct2 / num_samples
-        avg_raw_current_ct3 = sum_raw_current_ct3 / num_samples
-        avg_raw_current_ct4 = sum_raw_current_ct4 / num_samples
-        avg_raw_current_ct5 = sum_raw_current_ct5 / num_samples
-        avg_raw_current_ct6 = sum_raw_current_ct6 / num_samples
-        avg_raw_voltage_1 = sum_raw_voltage_1 / num_samples
-        avg_raw_voltage_2 = sum_raw_voltage_2 / num_samples
-        avg_raw_voltage_3 = sum_raw_voltage_3 / num_samples
-        avg_raw_voltage_4 = sum_raw_voltage_4 / num_samples
-        avg_raw_voltage_5 = sum_raw_voltage_5 / num_samples
-        avg_raw_voltage_6 = sum_raw_voltage_6 / num_samples
-
-        real_power_1 = ((sum_inst_power_ct1 / num_samples) - (avg_raw_current_ct1 * avg_raw_voltage_1))  * ct1_scaling_factor * voltage_scaling_factor
-        real_power_2 = ((sum_inst_power_ct2 / num_samples) - (avg_raw_current_ct2 * avg_raw_voltage_2))  * ct2_scaling_factor * voltage_scaling_factor
-        real_power_3 = ((sum_inst_power_ct3 / num_samples) - (avg_raw_current_ct3 * avg_raw_voltage_3))  * ct3_scaling_factor * voltage_scaling_factor
-        real_power_4 = ((sum_inst_power_ct4 / num_samples) - (avg_raw_current_ct4 * avg_raw_voltage_4))  * ct4_scaling_factor * voltage_scaling_factor
-        real_power_5 = ((sum_inst_power_ct5 / num_samples) - (avg_raw_current_ct5 * avg_raw_voltage_5))  * ct5_scaling_factor * voltage_scaling_factor
-        real_power_6 = ((sum_inst_power_ct6 / num_samples) - (avg_raw_current_ct6 * avg_raw_voltage_6))  * ct6_scaling_factor * voltage_scaling_factor
-
-        mean_square_current_ct1 = sum_squared_current_ct1 / num_samples
-        mean_square_current_ct2 = sum_squared_current_ct2 / num_samples
-        mean_square_current_ct3 = sum_squared_current_ct3 / num_samples
-        mean_square_current_ct4 = sum_squared_current_ct4 / num_samples
-        mean_square_current_ct5 = sum_squared_current_ct5 / num_samples
-        mean_square_current_ct6 = sum_squared_current_ct6 / num_samples
-        mean_square_voltage_1 = sum_squared_voltage_1 / num_samples
-        mean_square_voltage_2 = sum_squared_voltage_2 / num_samples
-        mean_square_voltage_3 = sum_squared_voltage_3 / num_samples
-        mean_square_voltage_4 = sum_squared_voltage_4 / num_samples
-        mean_square_voltage_5 = sum_squared_voltage_5 / num_samples
-        mean_square_voltage_6 = sum_squared_voltage_6 / num_samples
-
-        rms_current_ct1 = sqrt(mean_square_current_ct1 - (avg_raw_current_ct1 * avg_raw_current_ct1)) * ct1_scaling_factor
-        rms_current_ct2 = sqrt(mean_square_current_ct2 - (avg_raw_current_ct2 * avg_raw_current_ct2)) * ct2_scaling_factor
-        rms_current_ct3 = sqrt(mean_square_current_ct3 - (avg_raw_current_ct3 * avg_raw_current_ct3)) * ct3_scaling_factor
-        rms_current_ct4 = sqrt(mean_square_current_ct4 - (avg_raw_current_ct4 * avg_raw_current_ct4)) * ct4_scaling_factor
-        rms_current_ct5 = sqrt(mean_square_current_ct5 - (avg_raw_current_ct5 * avg_raw_current_ct5)) * ct5_scaling_factor
-        rms_current_ct6 = sqrt(mean_square_current_ct6 - (avg_raw_current_ct6 * avg_raw_current_ct6)) * ct6_scaling_factor
-        rms_voltage_1 = sqrt(mean_square_voltage_1 - (avg_raw_voltage_1 * avg_raw_voltage_1)) * voltage_scaling_factor
-        rms_voltage_2 = sqrt(mean_square_voltage_2 - (avg_raw_voltage_2 * avg_raw_voltage_2)) * voltage_scaling_factor
-        rms_voltage_3 = sqrt(mean_square_voltage_3 - (avg_raw_voltage_3 * avg_raw_voltage_3)) * voltage_scaling_factor
-        rms_voltage_4 = sqrt(mean_square_voltage_4 - (avg_raw_voltage_4 * avg_raw_voltage_4)) * voltage_scaling_factor
-        rms_voltage_5 = sqrt(mean_square_voltage_5 - (avg_raw_voltage_5 * avg_raw_voltage_5)) * voltage_scaling_factor
-        rms_voltage_6 = sqrt(mean_square_voltage_6 - (avg_raw_voltage_6 * avg_raw_voltage_6)) * voltage_scaling_factor
+        ct_scaling_factors = vref * self._ct_scale
+        voltage_scaling_factor = vref * self._v_scale
+
+        inv_num_samples = 1.0 / num_samples
+
+        # Real power is the covariance of current and voltage, and the RMS values are the square roots of their variances.
+        # The variances are clamped at 0 so that rounding can't push a flat (disconnected) channel's value negative.
+        real_power = power_comoment * (inv_num_samples * inv_num_samples) * (vref * vref) * self._power_scale
+        rms_current = np.sqrt(np.maximum(0.0, current_comoment)) * inv_num_samples * ct_scaling_factors
+        rms_voltage = np.sqrt(np.maximum(0.0, voltage_comoment)) * inv_num_samples * voltage_scaling_factor
 
         # Power Factor
-        apparent_power_1 = rms_voltage_1 * rms_current_ct1
-        apparent_power_2 = rms_voltage_2 * rms_current_ct2
-        apparent_power_3 = rms_voltage_3 * rms_current_ct3
-        apparent_power_4 = rms_voltage_4 * rms_current_ct4
-        apparent_power_5 = rms_voltage_5 * rms_current_ct5
-        apparent_power_6 = rms_voltage_6 * rms_current_ct6
+        apparent_power = rms_voltage * rms_current
+        power_factor = np.divide(real_power, apparent_power, out=np.zeros(6), where=apparent_power > 0)
 
-        try:
-            power_factor_1 = real_power_1 / apparent_power_1
-        except ZeroDivisionError:
-            power_factor_1 = 0
-        try:
-            power_factor_2 = real_power_2 / apparent_power_2
-        except ZeroDivisionError:
-            power_factor_2 = 0
-        try:
-            power_factor_3 = real_power_3 / apparent_power_3
-        except ZeroDivisionError:
-            power_factor_3 = 0
-        try:
-            power_factor_4 = real_power_4 / apparent_power_4
-        except ZeroDivisionError:
-            power_factor_4 = 0
-        try:
-            power_factor_5 = real_power_5 / apparent_power_5
-        except ZeroDivisionError:
-            power_factor_5 = 0
-        try:
-            power_factor_6 = real_power_6 / apparent_power_6
-        except ZeroDivisionError:
-            power_factor_6 = 0
-
-        results = {
-            'ct1': {
-                'type': 'consumption',
-                'power': real_power_1,
-                'current': rms_current_ct1,
-                'voltage': rms_voltage_1,
-                'pf': power_factor_1
-            },
-            'ct2': {
-                'type': 'consumption',
-                'power': real_power_2,
-                'current': rms_current_ct2,
-                'voltage': rms_voltage_2,
-                'pf': power_factor_2
-            },
-            'ct3': {
-                'type': 'consumption',
-                'power': real_power_3,
-                'current': rms_current_ct3,
-                'voltage': rms_voltage_3,
-                'pf': power_factor_3
-            },
-            'ct4': {
-                'type': 'consumption',
-                'power': real_power_4,
-                'current': rms_current_ct4,
-                'voltage': rms_voltage_4,
-                'pf': power_factor_4
-            },
-            'ct5': {
-                'type': 'consumption',
-                'power': real_power_5,
-                'current': rms_current_ct5,
-                'voltage': rms_voltage_5,
-                'pf': power_factor_5
-            },
-            'ct6': {
-                'type': 'consumption',
-                'power': real_power_6,
-                'current': rms_current_ct6,
-                'voltage': rms_voltage_6,
-                'pf': power_factor_6
-            },
-            'voltage': rms_voltage_1,
-        }
+        results = np.empty(6, dtype=RESULT_DTYPE)
+        results['power'] = real_power
+        results['current'] = rms_current
+        results['voltage'] = rms_voltage
+        results['pf'] = power_factor
 
         return results
 
@@ -416,7 +477,7 @@ class RPiPowerMonitor:
         """ Adjusts the sampled voltage wave to correct for the phase error introduced by time differences between the voltage sample and each channel's current sample.
         
         Arguments:
-        samples     -- dict, a dictionary containing lists of each channel's sample data, and a tailored voltage wave that's been phase corrected for each corresponding channel.
+        samples     -- dict, the samples returned by collect_data()
         PHASE_CAL_1 -- float, the phase correction constant for channel 1
         PHASE_CAL_2 -- float, the phase correction constant for channel 2
         PHASE_CAL_3 -- float, the phase correction constant for channel 3
@@ -424,57 +485,26 @@ class RPiPowerMonitor:
         PHASE_CAL_5 -- float, the phase correction constant for channel 5
         PHASE_CAL_6 -- float, the phase correction constant for channel 6
 
-        Returns a dictionary where the keys are ct1 through ct6, v_ct1 through v_ct6, and voltage. The ct1 - ct6 keys contains a list of the original current samples taken for each channel. 
-        The v_ct1 - v_ct6 keys contain a list of the phase-corrected voltage samples corresponding to each channel.
+        Returns a dictionary where the keys are ct, v, and voltage. 'ct' is a (6, N) array holding the original current samples taken for each channel (one row per CT).
+        'v' is a (6, N) float32 array holding the phase-corrected voltage samples corresponding to each channel, and 'voltage' holds the original voltage samples.
+        'ct' and 'voltage' are views of the samples, not copies.
         """
-        wave_1 = []
-        wave_2 = []
-        wave_3 = []
-        wave_4 = []
-        wave_5 = []
-        wave_6 = []
-
         voltage_samples = samples['voltage']
+        # float32 is plenty for 10-bit samples and halves the memory written here. _power_sums() accumulates in float64.
+        v = voltage_samples.astype(np.float32)
+        phasecal = np.array([PHASECAL_1, PHASECAL_2, PHASECAL_3, PHASECAL_4, PHASECAL_5, PHASECAL_6], dtype=np.float32)[:, None]
 
-        wave_1.append(voltage_samples[0])
-        wave_2.append(voltage_samples[0])
-        wave_3.append(voltage_samples[0])
-        wave_4.append(voltage_samples[0])
-        wave_5.append(voltage_samples[0])
-        wave_6.append(voltage_samples[0])
-        previous_point = voltage_samples[0]
-
-        for current_point in voltage_samples[1:]:
-            new_point_1 = previous_point + PHASECAL_1 * (current_point - previous_point)
-            new_point_2 = previous_point + PHASECAL_2 * (current_point - previous_point)
-            new_point_3 = previous_point + PHASECAL_3 * (current_point - previous_point)
-            new_point_4 = previous_point + PHASECAL_4 * (current_point - previous_point)
-            new_point_5 = previous_point + PHASECAL_5 * (current_point - previous_point)
-            new_point_6 = previous_point + PHASECAL_6 * (current_point - previous_point)
-
-            wave_1.append(new_point_1)
-            wave_2.append(new_point_2)
-            wave_3.append(new_point_3)
-            wave_4.append(new_point_4)
-            wave_5.append(new_point_5)
-            wave_6.append(new_point_6)
-
-            previous_point = current_point
+        # Each new point is interpolated between the previous and current voltage samples: previous + PHASECAL * (current - previous).
+        # The first point of every wave is the first voltage sample as-is.
+        previous_points = v[:-1]
+        waves = np.empty((6, len(v)), dtype=np.float32)
+        waves[:, 0] = v[0]
+        waves[:, 1:] = previous_points + phasecal * (v[1:] - previous_points)
 
         rebuilt_waves = {
-            'v_ct1': wave_1,
-            'v_ct2': wave_2,
-            'v_ct3': wave_3,
-            'v_ct4': wave_4,
-            'v_ct5': wave_5,
-            'v_ct6': wave_6,
+            'ct': samples['raw'][:6],
+            'v': waves,
             'voltage': voltage_samples,
-            'ct1': samples['ct1'],
-            'ct2': samples['ct2'],
-            'ct3': samples['ct3'],
-            'ct4': samples['ct4'],
-            'ct5': samples['ct5'],
-            'ct6': samples['ct6'],
         }
 
         return rebuilt_waves
@@ -483,24 +513,44 @@ class RPiPowerMonitor:
         """ Starts the main power monitor loop. """
         logger.info("... Starting Raspberry Pi Power Monitor")
         logger.info("Press Ctrl-c to quit...")
-        # The following empty dictionaries will hold the respective calculated values at the end
-        # of each polling cycle, which are then averaged prior to storing the value to the DB.
-        solar_power_values = dict(power=[], pf=[], current=[])
-        home_load_values = dict(power=[], pf=[], current=[])
-        net_power_values = dict(power=[], current=[])
-        ct1_dict = dict(power=[], pf=[], current=[])
-        ct2_dict = dict(power=[], pf=[], current=[])
-        ct3_dict = dict(power=[], pf=[], current=[])
-        ct4_dict = dict(power=[], pf=[], current=[])
-        ct5_dict = dict(power=[], pf=[], current=[])
-        ct6_dict = dict(power=[], pf=[], current=[])
-        rms_voltages = []
+        # The following arrays will hold the respective calculated values at the end of each polling cycle,
+        # which are then averaged prior to storing the value to the DB. They're allocated once and refilled
+        # from the start after every write, so i is all that has to be reset.
+        num_readings = 2    # The number of readings to average for each write
+        solar_power_values = dict(power=np.empty(num_readings), pf=np.empty(num_readings), current=np.empty(num_readings))
+        home_load_values = dict(power=np.empty(num_readings), current=np.empty(num_readings))
+        net_power_values = dict(power=np.empty(num_readings), current=np.empty(num_readings))
+        ct_values = np.empty((num_readings, 6), dtype=RESULT_DTYPE)    # One row of per-CT results for each reading
+        rms_voltages = np.empty(num_readings)
         i = 0   # Counter for aggregate function
 
+        # Sampling runs in a background thread so that the next batch is read from the ADC while this one is processed.
+        # The two buffers are passed back and forth between the threads: one is being filled while the other is processed.
+        free_buffers = queue.Queue()
+        full_buffers = queue.Queue()
+        for _ in range(2):
+            free_buffers.put(np.empty((7, 2000), dtype=np.int16))
+        sampler = threading.Thread(target=self._sample_continuously, args=(2000, free_buffers, full_buffers), daemon=True)
+        sampler.start()
+
+        # Writes to InfluxDB are done by another background thread so that a slow database never holds up sampling.
+        # Its errors are passed back through full_buffers, the same as the sampler's.
+        influx_queue = queue.Queue(maxsize=64)
+        influx_lost = threading.Event()
+        writer = threading.Thread(target=self._write_points_continuously, args=(influx_queue, influx_lost, full_buffers), daemon=True)
+        writer.start()
+
         while True:
             try:
-                board_voltage = self.get_board_voltage()
-                samples = self.collect_data(2000)
+                if influx_lost.is_set():
+                    self._stop_writer(influx_queue, writer)
+                    infl.close_db()
+                    sys.exit()
+
+                batch = full_buffers.get()
+                if isinstance(batch, Exception):
+                    raise batch
+                board_voltage, samples = batch
                 poll_time = samples['time']
 
                 # ct1_samples = samples['ct1']
@@ -511,50 +561,27 @@ class RPiPowerMonitor:
                 # ct6_samples = samples['ct6']
                 # v_samples = samples['voltage']
 
-                rebuilt_waves = self.rebuild_waves(
-                    samples,
-                    self.ct_phase_correction['ct1'],
-                    self.ct_phase_correction['ct2'],
-                    self.ct_phase_correction['ct3'],
-                    self.ct_phase_correction['ct4'],
-                    self.ct_phase_correction['ct5'],
-                    self.ct_phase_correction['ct6'])
-                results = self.calculate_power(rebuilt_waves, board_voltage)
+                results = self.calculate_power_fast(samples, board_voltage)
+                free_buffers.put(samples['raw'])    # The samples aren't needed anymore, so the sampler can refill this buffer.
 
                 # RMS calculation for phase correction only - this is not needed after everything is tuned.
                 # The following code is used to compare the RMS power to the calculated real power.
                 # Ideally, you want the RMS power to equal the real power when measuring a purely resistive load.
-                # rms_power_1 = round(results['ct1']['current'] * results['ct1']['voltage'], 2)  # AKA apparent power
-                # rms_power_2 = round(results['ct2']['current'] * results['ct2']['voltage'], 2)  # AKA apparent power
-                # rms_power_3 = round(results['ct3']['current'] * results['ct3']['voltage'], 2)  # AKA apparent power
-                # rms_power_4 = round(results['ct4']['current'] * results['ct4']['voltage'], 2)  # AKA apparent power
-                # rms_power_5 = round(results['ct5']['current'] * results['ct5']['voltage'], 2)  # AKA apparent power
-                # rms_power_6 = round(results['ct6']['current'] * results['ct6']['voltage'], 2)  # AKA apparent power
+                # rms_powers = np.round(results['current'] * results['voltage'], 2)  # AKA apparent power, one per CT
 
                 # Prepare values for database storage
-                grid_1_power = results['ct1']['power']    # ct1 Real Power
-                grid_2_power = results['ct2']['power']    # ct2 Real Power
-                grid_3_power = results['ct3']['power']    # ct3 Real Power
-                grid_4_power = results['ct4']['power']    # ct4 Real Power
-                grid_5_power = results['ct5']['power']    # ct5 Real Power
-                grid_6_power = results['ct6']['power']    # ct6 Real Power
-
-                grid_1_current = results['ct1']['current']  # ct1 Current
-                grid_2_current = results['ct2']['current']  # ct2 Current
-                grid_3_current = results['ct3']['current']  # ct3 Current
-                grid_4_current = results['ct4']['current']  # ct4 Current
-                grid_5_current = results['ct5']['current']  # ct5 Current
-                grid_6_current = results['ct6']['current']  # ct6 Current
+                grid_powers = results['power']              # Real Power, one per CT
+                grid_currents = results['current'].copy()   # Current, one per CT (copied so the signs below don't change results)
 
                 # If you are monitoring solar/generator inputs to your panel,
                 # specify which CT number(s) you are using, and uncomment the commented lines.
                 solar_power = 0
                 solar_current = 0
                 solar_pf = 0
-                # solar_power = results['ct4']['power']
-                # solar_current = results['ct4']['current']
-                # solar_pf = results['ct4']['pf']
-                voltage = results['voltage']
+                # solar_power = results[3]['power']
+                # solar_current = results[3]['current']
+                # solar_pf = results[3]['pf']
+                voltage = results[0]['voltage']
 
                 # Set solar power and current to zero if the solar power is under 20W.
                 if solar_power < 20:
@@ -565,25 +592,16 @@ class RPiPowerMonitor:
                 # Determine if the system is net producing or net consuming right now by looking at the two panel mains.
                 # Since the current measured is always positive,
                 # we need to add a negative sign to the amperage value if we're exporting power.
-                if grid_1_power < 0:
-                    grid_1_current = grid_1_current * -1
-                if grid_2_power < 0:
-                    grid_2_current = grid_2_current * -1
+                grid_currents[:2] = np.copysign(grid_currents[:2], grid_powers[:2])
                 if solar_power > 0:
                     solar_current = solar_current * -1
 
                 # Unless your specific panel setup matches mine exactly,
                 # the following four lines will likely need to be re-written:
-                home_consumption_power = (
-                        grid_1_power + grid_2_power + grid_3_power +
-                        grid_4_power + grid_5_power + grid_6_power + solar_power)
+                home_consumption_power = grid_powers.sum() + solar_power
                 net_power = home_consumption_power - solar_power
-                home_consumption_current = (
-                        grid_1_current + grid_2_current + grid_3_current +
-                        grid_4_current + grid_5_current + grid_6_current - solar_current)
-                net_current = (
-                        grid_1_current + grid_2_current + grid_3_current +
-                        grid_4_current + grid_5_current + grid_6_current + solar_current)
+                home_consumption_current = grid_currents.sum() - solar_current
+                net_current = grid_currents.sum() + solar_current
 
                 # if net_power < 0:
                 #     current_status = "Producing"
@@ -591,94 +609,112 @@ class RPiPowerMonitor:
                 #     current_status = "Consuming"
 
                 # Average 2 readings before sending to db
-                if i < 2:
-                    solar_power_values['power'].append(solar_power)
-                    solar_power_values['current'].append(solar_current)
-                    solar_power_values['pf'].append(solar_pf)
-
-                    home_load_values['power'].append(home_consumption_power)
-                    home_load_values['current'].append(home_consumption_current)
-                    net_power_values['power'].append(net_power)
-                    net_power_values['current'].append(net_current)
-
-                    ct1_dict['power'].append(results['ct1']['power'])
-                    ct1_dict['current'].append(results['ct1']['current'])
-                    ct1_dict['pf'].append(results['ct1']['pf'])
-                    ct2_dict['power'].append(results['ct2']['power'])
-                    ct2_dict['current'].append(results['ct2']['current'])
-                    ct2_dict['pf'].append(results['ct2']['pf'])
-                    ct3_dict['power'].append(results['ct3']['power'])
-                    ct3_dict['current'].append(results['ct3']['current'])
-                    ct3_dict['pf'].append(results['ct3']['pf'])
-                    ct4_dict['power'].append(results['ct4']['power'])
-                    ct4_dict['current'].append(results['ct4']['current'])
-                    ct4_dict['pf'].append(results['ct4']['pf'])
-                    ct5_dict['power'].append(results['ct5']['power'])
-                    ct5_dict['current'].append(results['ct5']['current'])
-                    ct5_dict['pf'].append(results['ct5']['pf'])
-                    ct6_dict['power'].append(results['ct6']['power'])
-                    ct6_dict['current'].append(results['ct6']['current'])
-                    ct6_dict['pf'].append(results['ct6']['pf'])
-                    rms_voltages.append(voltage)
+                if i < num_readings:
+                    solar_power_values['power'][i] = solar_power
+                    solar_power_values['current'][i] = solar_current
+                    solar_power_values['pf'][i] = solar_pf
+
+                    home_load_values['power'][i] = home_consumption_power
+                    home_load_values['current'][i] = home_consumption_current
+                    net_power_values['power'][i] = net_power
+                    net_power_values['current'][i] = net_current
+
+                    ct_values[i] = results
+                    rms_voltages[i] = voltage
                     i += 1
                 else:
-                    # Calculate the average, send the result to InfluxDB
-                    # and reset the dictionaries for the next 2 sets of data.
-                    infl.write_to_influx(
+                    # Calculate the average, queue the result to be sent to InfluxDB,
+                    # and start over for the next 2 sets of data.
+                    points = infl.build_points(
                         solar_power_values,
                         home_load_values,
                         net_power_values,
-                        ct1_dict,
-                        ct2_dict,
-                        ct3_dict,
-                        ct4_dict,
-                        ct5_dict,
-                        ct6_dict,
+                        ct_values,
                         poll_time,
                         i,
                         rms_voltages)
-                    solar_power_values = dict(power=[], pf=[], current=[])
-                    home_load_values = dict(power=[], pf=[], current=[])
-                    net_power_values = dict(power=[], current=[])
-                    ct1_dict = dict(power=[], pf=[], current=[])
-                    ct2_dict = dict(power=[], pf=[], current=[])
-                    ct3_dict = dict(power=[], pf=[], current=[])
-                    ct4_dict = dict(power=[], pf=[], current=[])
-                    ct5_dict = dict(power=[], pf=[], current=[])
-                    ct6_dict = dict(power=[], pf=[], current=[])
-                    rms_voltages = []
+                    try:
+                        influx_queue.put_nowait(points)
+                    except queue.Full:
+                        try:
+                            influx_queue.get_nowait()
+                        except queue.Empty:
+                            pass    # The writer thread caught up in the meantime.
+                        influx_queue.put_nowait(points)
+                        logger.warning("InfluxDB is falling behind. The oldest unsent reading was dropped.")
                     i = 0
 
-                    if logger.handlers[0].level == 10:
+                    if logger.isEnabledFor(logging.DEBUG):
                         self.print_results(results)
 
                 # sleep(0.1)
 
             except KeyboardInterrupt:
+                self._stop_writer(influx_queue, writer)
                 infl.close_db()
                 sys.exit()
 
+    def _sample_continuously(self, num_samples, free_buffers, full_buffers):
+        """ Sampler thread for run_main(). Takes an empty buffer from <free_buffers>, fills it with a batch of samples, and puts
+        the board voltage and the samples onto <full_buffers>. Any error is put onto <full_buffers> so that run_main() can raise it.
+        """
+        try:
+            while True:
+                buffer = free_buffers.get()
+                board_voltage = self.get_board_voltage()
+                full_buffers.put((board_voltage, self.collect_data(num_samples, buffer)))
+        except Exception as e:
+            full_buffers.put(e)
+
+    @staticmethod
+    def _write_points_continuously(influx_queue, influx_lost, errors):
+        """ InfluxDB writer thread for run_main(). Writes each list of points put onto <influx_queue> until it gets None, and sets
+        <influx_lost> and stops if the connection to InfluxDB is lost. Any other error is put onto <errors> so that run_main() can raise it.
+        """
+        try:
+            while True:
+                points = influx_queue.get()
+                if points is None:
+                    return
+                if not infl.write_points(points):
+                    influx_lost.set()
+                    return
+        except Exception as e:
+            errors.put(e)
+
+    @staticmethod
+    def _stop_writer(influx_queue, writer):
+        """ Stops run_main()'s InfluxDB writer thread once it has written the points already on <influx_queue>, waiting at most
+        _WRITER_SHUTDOWN_TIMEOUT seconds, so that the database can be closed without cutting off a write.
+        """
+        if not writer.is_alive():
+            return  # The writer stopped on its own, ie, the connection to InfluxDB was lost.
+        try:
+            influx_queue.put(None, timeout=_WRITER_SHUTDOWN_TIMEOUT)
+        except queue.Full:
+            pass    # The writer is stuck, so the join below times out too.
+        writer.join(_WRITER_SHUTDOWN_TIMEOUT)
+        if writer.is_alive():
+            logger.warning("Timed out waiting for the last readings to be written to InfluxDB. They may have been lost.")
+
     @staticmethod
     def rebuild_wave(samples, v_wave, PHASECAL):
         """ Rebuilds a single voltage wave by applying the PHASECAL constant to the voltage samples contained in v_wave.
 
         Arguments:
-        samples     -- list, contains the raw ADC readings from a single CT input
-        v_wave      -- list, contians raw ADC readings from the original voltage waveform
+        samples     -- array or list, contains the raw ADC readings from a single CT input
+        v_wave      -- array or list, contians raw ADC readings from the original voltage waveform
         PHASECAL:   -- float, the phase correction constant for this channel.
-        """
-        
-
-        # The following empty lists will hold the phase corrected voltage wave that corresponds to each individual CT sensor.
-        wave = []
 
-        wave.append(v_wave[0])
-        previous_point = v_wave[0]
-
-        for current_point in v_wave[1:]:
-            new_point = previous_point + PHASECAL * (current_point - previous_point)
-            wave.append(new_point)
-            previous_point = current_point
+        Returns a dictionary where 'new_v' is the rebuilt voltage wave as a float64 array, 'ct' holds the CT samples, and 'original_v' the voltage samples.
+        """
+        # Each new point is interpolated between the previous and current voltage samples: previous + PHASECAL * (current - previous).
+        # The first point of the wave is the first voltage sample as-is.
+        v = np.asarray(v_wave, dtype=np.float64)
+        previous_points = v[:-1]
+        wave = np.empty_like(v)
+        wave[:1] = v[:1]
+        wave[1:] = previous_points + PHASECAL * (v[1:] - previous_points)
 
         rebuilt_wave = {
             'new_v': wave,  # Rebuilt voltage wave
@@ -688,229 +724,149 @@ class RPiPowerMonitor:
         return rebuilt_wave
 
     @staticmethod
-    def check_phasecal(samples, rebuilt_wave, board_voltage):
-        """ This function is a trimmed down version of the calculate_power(). It's primary purpose is to aid in the finding of the ideal
-        PHASECAL constant for this channel by calculating the power using the already-phase-corrected rebuilt_wave.
-        
+    def phasecal_scaling_factors(board_voltage):
+        """ Returns the CT and voltage scaling factors for check_phasecal() and check_phasecal_fused(), which only change with the board voltage.
+
         Arguments:
-        samples         -- list, raw ADC output values for a single CT
-        rebuilt_wave    -- list, phase-corrected voltage wave for the single CT
         board_voltage   -- float, current reading of the reference voltage from the +3.3V rail
-
-        Returns a dictionary containing the power, current, voltage, and power factor (pf) for this channel so that the caller can determine if the
-        PHASECAL constant applied for this check was better than the previous PHASECAL constant.
         """
-
-        # Variable Initialization
-        sum_inst_power = 0
-        sum_squared_current = 0
-        sum_raw_current = 0
-        sum_squared_voltage = 0
-        sum_raw_voltage = 0
-
-        # Scaling factors
         vref = board_voltage / 1024
         # ct_scaling_factor = vref * 100 * ct_accuracy_factor
         ct_scaling_factor = vref * 100
         # voltage_scaling_factor = vref * 126.5 * AC_voltage_accuracy_factor
         voltage_scaling_factor = vref * 126.5
+        return ct_scaling_factor, voltage_scaling_factor
 
-        num_samples = len(rebuilt_wave)
-
-        for i in range(0, num_samples):
-            ct = (int(samples[i]))
-            voltage = (int(rebuilt_wave[i]))
-
-            # Process all data in a single function to reduce runtime complexity
-            # Get the sum of all current samples individually
-            sum_raw_current += ct
-            sum_raw_voltage += voltage
-
-            # Calculate instant power for each ct sensor
-            inst_power = ct * voltage
-            sum_inst_power += inst_power
-
-            # Squared voltage
-            squared_voltage = voltage * voltage
-            sum_squared_voltage += squared_voltage
-
-            # Squared current
-            sq_ct = ct * ct
-            sum_squared_current += sq_ct
+    @staticmethod
+    def check_phasecal(samples, rebuilt_wave, ct_scaling_factor, voltage_scaling_factor):
+        """ This function is a trimmed down version of the calculate_power(). It's primary purpose is to aid in the finding of the ideal
+        PHASECAL constant for this channel by calculating the power using the already-phase-corrected rebuilt_wave.
+        
+        Arguments:
+        samples         -- array or list, raw ADC output values for a single CT
+        rebuilt_wave    -- array or list, phase-corrected voltage wave for the single CT
+        ct_scaling_factor      -- float, the CT scaling factor from phasecal_scaling_factors()
+        voltage_scaling_factor -- float, the voltage scaling factor from phasecal_scaling_factors()
 
-        avg_raw_current = sum_raw_current / num_samples
-        avg_raw_voltage = sum_raw_voltage / num_samples
+        Returns a dictionary containing the power, current, voltage, and power factor (pf) for this channel so that the caller can determine if the
+        PHASECAL constant applied for this check was better than the previous PHASECAL constant.
+        """
 
-        real_power = ((sum_inst_power / num_samples) - (
-                    avg_raw_current * avg_raw_voltage)) * ct_scaling_factor * voltage_scaling_factor
+        # The sums are taken by _power_sums(), as a single channel. The rebuilt wave isn't truncated to whole numbers, so that the
+        # results are the same as check_phasecal_fused()'s and find_phasecal()'s for the same PHASECAL.
+        ct = np.asarray(samples, dtype=np.float64)
+        voltage = np.asarray(rebuilt_wave, dtype=np.float64)
+        num_samples = len(voltage)
 
-        mean_square_current = sum_squared_current / num_samples
-        mean_square_voltage = sum_squared_voltage / num_samples
+        sum_raw_current, sum_raw_voltage, sum_squared_current, sum_squared_voltage, sum_inst_power = _power_sums(ct[None], voltage[None])[0].tolist()
 
-        rms_current = sqrt(mean_square_current - (avg_raw_current * avg_raw_current)) * ct_scaling_factor
-        rms_voltage = sqrt(mean_square_voltage - (avg_raw_voltage * avg_raw_voltage)) * voltage_scaling_factor
+        return _phasecal_results(
+            num_samples * sum_squared_current - sum_raw_current * sum_raw_current,
+            num_samples * sum_squared_voltage - sum_raw_voltage * sum_raw_voltage,
+            num_samples * sum_inst_power - sum_raw_current * sum_raw_voltage,
+            num_samples,
+            ct_scaling_factor,
+            voltage_scaling_factor)
 
-        apparent_power = rms_voltage * rms_current
+    @staticmethod
+    def check_phasecal_fused(samples, v_wave, PHASECAL, ct_scaling_factor, voltage_scaling_factor):
+        """ Does the same as check_phasecal(rebuild_wave(samples, v_wave, PHASECAL)['new_v']), in a single pass over the raw samples
+        without building the rebuilt wave.
 
-        try:
-            power_factor = real_power / apparent_power
-        except ZeroDivisionError:
-            power_factor = 0
-
-        results = {
-            'power': real_power,
-            'current': rms_current,
-            'voltage': rms_voltage,
-            'pf': power_factor
-        }
+        Arguments:
+        samples         -- array or list, raw ADC output values for a single CT
+        v_wave          -- array or list, raw ADC readings from the original voltage waveform
+        PHASECAL        -- float, the phase correction constant to check
+        ct_scaling_factor      -- float, the CT scaling factor from phasecal_scaling_factors()
+        voltage_scaling_factor -- float, the voltage scaling factor from phasecal_scaling_factors()
 
-        return results
+        Returns the same dictionary as check_phasecal().
+        """
+        return _phasecal_results(*_phase_kernel(samples, v_wave, PHASECAL), len(v_wave), ct_scaling_factor, voltage_scaling_factor)
 
     def find_phasecal(self, samples, ct_selection, accuracy_digits, board_voltage):
         """ Determines the indeal PHASECAL constant to achieve a power factor closest to 1.  Assumes that the user is measuring a purely resistive load.
         
         Arguments:
-        samples         -- dict, a dictionary containing lists of each channel's sample data
+        samples         -- dict, the samples returned by collect_data(), which are used for the first of the 3 waves
         ct_selection    -- int, the channel number selected by the user
-        accuracy_digits -- int, currently unused, but would control the rounding of the measured PF. It's currently hardcoded to 4 below.
-        board_voltage   -- float, the latest measured board voltage from the +3.3 rail.
+        accuracy_digits -- int, currently unused, but would control the rounding of the measured PF.
+        board_voltage   -- float, the latest measured board voltage from the +3.3 rail. Currently unused, since it cancels out of the PF.
 
-        Returns a list of dicts, where each dict holds the best power factor values and the corresponding PHASECAL constant that was used to calculate the PF.
+        Returns a (3, 2) array with a row for each wave, where column 0 holds the best power factor value and column 1 the corresponding PHASECAL constant that was used to calculate the PF.
+        Both columns are NaN for a wave where no peak in the PF was found.
         """
-        # This controls how many times the calibration process is repeated for this particular CT.
-        num_calibration_attempts = 20
-
-        # Get Initial PF
-        rebuilt_wave = self.rebuild_wave(samples[ct_selection], samples['voltage'], 1.0)
-        results = self.check_phasecal(rebuilt_wave['ct'], rebuilt_wave['new_v'], board_voltage)
-        pf = results['pf']
-        logger.debug(
-            f"Please wait while I read {ct_selection} and calculate the best PHASECAL value. This can take a few minutes, so please be patient.")
-
-        best_pfs = []
-        previous_phasecal = 1.0
-        previous_pf = pf
-        trends = []
-
-        # Base Increment settings for changing phasecal
-        increment = 1.005
-        decrement = 0.995
-        big_increment = 1.01
-        big_decrement = 0.98
-
-        for i, _ in enumerate(range(3), start=1):
-            best_pf = {
-                'pf': 0,
-                'cal': 0
-            }
-            for _ in range(75):
-
-                if round(pf, 4) == 1.0:
-                    best_pf.update({
-                        'pf': pf,
-                        'cal': new_phasecal,
-                    })
-                    break
+        logger.debug("Please wait while I read %s and calculate the best PHASECAL value.", ct_selection)
 
-                if pf < 1.0:
-                    # If the PF isn't better than 0.995, we can increment the phasecal by an amount twice as large, referred to as big_increment, to help speed up the process.
-                    if round(pf, 2) != 1.0:
-                        new_phasecal = previous_phasecal * big_increment
-                    else:
-                        new_phasecal = previous_phasecal * increment
-                    action = 'incremented'
-                else:
-                    if round(pf, 2) != 1.0:
-                        new_phasecal = previous_phasecal * big_decrement
-                    else:
-                        new_phasecal = previous_phasecal * decrement
-                    action = 'decremented'
+        best_pfs = np.zeros((3, 2))     # One row per wave: the best power factor, and the PHASECAL it was found with
 
-                # Collect a live sample and calculate PF using new_phasecal
+        for i, _ in enumerate(range(3), start=1):
+            # PHASECAL is only applied when the samples are processed, so every PHASECAL for this wave is tried on the same samples.
+            # The first wave uses the samples that were passed in, and each of the others collects a fresh set.
+            if i > 1:
                 samples = self.collect_data(2000)
-                rebuilt_wave = self.rebuild_wave(samples[ct_selection], samples['voltage'], new_phasecal)
-                results = self.check_phasecal(rebuilt_wave['ct'], rebuilt_wave['new_v'], board_voltage)
-                pf = results['pf']
-                if pf > best_pf['pf']:
-                    best_pf.update({
-                        'pf': pf,
-                        'cal': new_phasecal
-                    })
-
-                # logger.debug(f"  PF: {pf} | Phasecal: {new_phasecal}")
-
-                # Determine whether or not trend is moving away from 1.0 or towards 1.0.
-                # Trend should be a moving average over two values.
-
-                trends.append(pf - previous_pf)
-                previous_phasecal = new_phasecal
-
-                if len(trends) == 2:
-                    # Check to see if both values have the same sign to determine the actual trend, then empty the list
-                    if trends[0] < 0:
-                        if trends[1] < 0:
-                            trend = 'worse'
-                            # If the trend is getting worse, reject the previous phasecal, and reduce cut increment/decrement by half.
-                            increment = 1 + (abs(1 - increment) / 2)
-                            decrement = decrement + ((1 - decrement) / 2)
-
-                            # Apply the opposite action to the previous phasecal value to attempt to reverse the trend. If the previous phasecal
-                            # was incremented, then we will decrement using the newly adjusted decrement value.
-                            if action == 'increment':
-                                # Decrement instead
-                                new_phasecal = previous_phasecal * decrement
-                            else:
-                                # Increment instead
-                                new_phasecal = previous_phasecal * increment
-
-                    if trends[1] > 0:
-                        trend = 'better'
-
-                    trends = []
-                    continue  # Skip updating the previous phasecal and previous_pf since we want to attempt to reverse the trend.
+            ct_samples = samples[ct_selection]
+            v_samples = samples['voltage']
 
-                else:
-                    if action == 'increment':
-                        # Repeat same action
-                        new_phasecal = previous_phasecal * increment
-                    else:
-                        new_phasecal = previous_phasecal * decrement
+            # The PF is calculated for a coarse grid of candidates in one go. If the best candidate is at the edge of the grid, the peak
+            # may be beyond it, so the grid is moved to centre on that candidate and searched again. A second, finer grid around the best
+            # candidate then pins the peak down.
+            low, high = 0.5, 1.5
+            searched_low, searched_high = low, high
+            for _ in range(_MAX_GRID_MOVES + 1):
+                coarse = np.linspace(low, high, 256)
+                searched_low, searched_high = min(searched_low, low), max(searched_high, high)
+                pfs = _phasecal_pfs(ct_samples, v_samples, coarse)
+                best = int(np.argmax(pfs))
+                if 0 < best < len(coarse) - 1:
+                    break
+                half_width = (high - low) / 2
+                low, high = coarse[best] - half_width, coarse[best] + half_width
+            else:
+                # The edge of the grid isn't a real peak, so there's no PHASECAL to recommend for this wave.
+                logger.warning(
+                    "No peak in the PF was found for %s between PHASECAL %s and %s. "
+                    "Please check the CT and the voltage transformer connections.",
+                    ct_selection, round(searched_low, 3), round(searched_high, 3))
+                best_pfs[i - 1] = np.nan
+                continue
+
+            step = coarse[1] - coarse[0]
+            fine = np.linspace(coarse[best] - step, coarse[best] + step, 256)
+            pfs = _phasecal_pfs(ct_samples, v_samples, fine)
+            best = int(np.argmax(pfs))
+            best_phasecal = fine[best]
 
-                previous_pf = pf
+            best_pfs[i - 1] = pfs[best], best_phasecal
 
-            logger.debug(f"Wave {i}/3 results: ")
-            logger.debug(f" Best PF: {best_pf['pf']} using phasecal: {best_pf['cal']}")
-            best_pfs.append(best_pf)
+            logger.debug("Wave %d/3 results: ", i)
+            logger.debug(" Best PF: %s using phasecal: %s", pfs[best], best_phasecal)
 
         return best_pfs
 
     @staticmethod
-    def print_results(results):
-        t = PrettyTable(['', 'ct1', 'ct2', 'ct3', 'ct4', 'ct5', 'ct6'])
-        t.add_row(['Watts',
-                   round(results['ct1']['power'], 3),
-                   round(results['ct2']['power'], 3),
-                   round(results['ct3']['power'], 3),
-                   round(results['ct4']['power'], 3),
-                   round(results['ct5']['power'], 3),
-                   round(results['ct6']['power'], 3)])
-        t.add_row(['Current',
-                   round(results['ct1']['current'], 3),
-                   round(results['ct2']['current'], 3),
-                   round(results['ct3']['current'], 3),
-                   round(results['ct4']['current'], 3),
-                   round(results['ct5']['current'], 3),
-                   round(results['ct6']['current'], 3)])
-        t.add_row(['P.F.',
-                   round(results['ct1']['pf'], 3),
-                   round(results['ct2']['pf'], 3),
-                   round(results['ct3']['pf'], 3),
-                   round(results['ct4']['pf'], 3),
-                   round(results['ct5']['pf'], 3),
-                   round(results['ct6']['pf'], 3)])
-        t.add_row(['Voltage', round(results['voltage'], 3), '', '', '', '', ''])
-        s = t.get_string()
-        logger.debug(f"\n{s}")
+    def print_results(results, pretty=False):
+        """ Logs a table of a cycle's results at debug level.
+
+        Arguments:
+        results -- array, the 6 RESULT_DTYPE records returned by calculate_power()
+        pretty  -- bool, draw the table with PrettyTable instead of the fixed-width format, which is faster and used every cycle
+        """
+        rows = (('Watts', 'power'), ('Current', 'current'), ('P.F.', 'pf'))
+        voltage = float(results[0]['voltage'])
+        if pretty:
+            t = PrettyTable(['', 'ct1', 'ct2', 'ct3', 'ct4', 'ct5', 'ct6'])
+            for label, field in rows:
+                t.add_row([label] + [round(value, 3) for value in results[field].tolist()])
+            t.add_row(['Voltage', round(voltage, 3), '', '', '', '', ''])
+            logger.debug("\n%s", t.get_string())
+            return
+
+        lines = [_RESULTS_HEADER]
+        for label, field in rows:
+            lines.append(_RESULTS_ROW.format(label, *results[field].tolist()))
+        lines.append(f"{'Voltage':>8} {voltage:>10.3f}")
+        logger.debug("\n%s", "\n".join(lines))
 
     @staticmethod
     def get_ip():
@@ -919,18 +875,18 @@ class RPiPowerMonitor:
         Returns a string representing the Pi's local IP address that's associated with the default route.
         """
         
-        s = socket(AF_INET, SOCK_DGRAM)
-        try:
-            s.connect(('10.255.255.255', 1))
-            ip = s.getsockname()[0]
-        except:
-            ip = None
-        finally:
-            s.close()
+        ip = _get_ip()
+        if ip is None:
+            # Don't hold on to a failed lookup - the network may just not be up yet.
+            _get_ip.cache_clear()
         return ip
 
 
 if __name__ == '__main__':
+    # systemd stops the service with SIGTERM. Handle it like Ctrl-c, so that run_main()'s shutdown runs and the buffered log
+    # lines are flushed at exit instead of being lost.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
     try:  # Backup config.py file
         copyfile('config.py', 'config.py.backup')
     except FileNotFoundError:
@@ -981,8 +937,7 @@ if __name__ == '__main__':
 
     else:
         # Program launched in one of the non-main modes. Increase logging level.
-        logger.setLevel(logging.DEBUG)
-        logger.handlers[0].setLevel(logging.DEBUG)      
+        set_log_level(logging.DEBUG)
         if 'help' in MODE.lower() or '-h' in MODE.lower():
 
             logger.info("See the project Wiki for more detailed usage instructions: "
@@ -1012,11 +967,11 @@ if __name__ == '__main__':
             duration = stop - start
 
             # Calculate Sample Rate in Kilo-Samples Per Second.
-            sample_count = sum([len(samples[x]) for x in samples.keys() if type(samples[x]) == list])
+            sample_count = samples['raw'].size
             
             sample_rate = round((sample_count / duration) / 1000, 2)
 
-            logger.debug(f"Finished Collecting Samples. Sample Rate: {sample_rate} KSPS")
+            logger.debug("Finished Collecting Samples. Sample Rate: %s KSPS", sample_rate)
             ct1_samples = samples['ct1']
             ct2_samples = samples['ct2']
             ct3_samples = samples['ct3']
@@ -1034,6 +989,7 @@ if __name__ == '__main__':
 
             title = title.replace(" ", "_")
             logger.debug("Building plot.")
+            from rpi_power_monitor.plotting import plot_data     # plotly is slow to import, so only load it when it's needed.
             plot_data(samples, title, sample_rate=sample_rate)
             ip = rpm.get_ip()
             if ip:
@@ -1076,11 +1032,11 @@ if __name__ == '__main__':
                 logger.info("\nCalibration Aborted.\n")
                 sys.exit()
 
+            # The PF is checked with check_phasecal_fused(), which calculates it the same way as find_phasecal()'s search.
             samples = rpm.collect_data(2000)
-            rebuilt_wave = rpm.rebuild_wave(
-                samples[ct_selection], samples['voltage'], rpm.ct_phase_correction[ct_selection])
             board_voltage = rpm.get_board_voltage()
-            results = rpm.check_phasecal(rebuilt_wave['ct'], rebuilt_wave['new_v'], board_voltage)
+            results = rpm.check_phasecal_fused(samples[ct_selection], samples['voltage'], rpm.ct_phase_correction[ct_selection],
+                                               *rpm.phasecal_scaling_factors(board_voltage))
 
             # Get the current power factor and check to make sure it is not negative.
             # If it is, the CT is installed opposite to how it should be.
@@ -1094,9 +1050,8 @@ if __name__ == '__main__':
                 input("[ENTER]")
                 # Check to make sure the CT was reversed properly by taking another batch of samples/calculations:
                 samples = rpm.collect_data(2000)
-                rebuilt_wave = rpm.rebuild_wave(samples[ct_selection], samples['voltage'], 1)
                 board_voltage = rpm.get_board_voltage()
-                results = rpm.check_phasecal(rebuilt_wave['ct'], rebuilt_wave['new_v'], board_voltage)
+                results = rpm.check_phasecal_fused(samples[ct_selection], samples['voltage'], 1, *rpm.phasecal_scaling_factors(board_voltage))
                 pf = results['pf']
                 if pf < 0:
                     logger.info(dedent("""It still looks like the current transformer is installed backwards. Are you sure this is a resistive load?\n
@@ -1111,15 +1066,24 @@ if __name__ == '__main__':
             samples = rpm.collect_data(2000)
             board_voltage = rpm.get_board_voltage()
             best_pfs = rpm.find_phasecal(samples, ct_selection, PF_ROUNDING_DIGITS, board_voltage)
-            avg_phasecal = sum([x['cal'] for x in best_pfs]) / len([x['cal'] for x in best_pfs])
+            if np.isnan(best_pfs).any():
+                logger.error(f"Could not find the best PHASECAL value for {ct_selection}, so ct_phase_correction was not calculated. "
+                             "Please check that the CT is installed over a purely resistive load that is turned on, and try again.")
+                sys.exit()
+            avg_phasecal = float(best_pfs[:, 1].mean())
             logger.info(f"Please update the value for {ct_selection} in ct_phase_correction "
                         f"in config.py with the following value: {round(avg_phasecal, 8)}")
+            if rpm.spi_speed_hz != rpm.ct_phase_correction_spi_hz:
+                # The new value was found at the current clock, so CT_PHASE_CORRECTION_SPI_HZ has to change with it.
+                logger.info(f"Also set CT_PHASE_CORRECTION_SPI_HZ in config.py to {rpm.spi_speed_hz}, and run 'phase' mode for "
+                            "the other CTs at this speed too.")
             logger.info("Please wait... building HTML plot...")
             # Get new set of samples using recommended phasecal value
             samples = rpm.collect_data(2000)
             rebuilt_wave = rpm.rebuild_wave(samples[ct_selection], samples['voltage'], avg_phasecal)
 
             report_title = f'CT{ct_num}-phase-correction-result'
+            from rpi_power_monitor.plotting import plot_data
             plot_data(rebuilt_wave, report_title, ct_selection)
             logger.info(f"file written to {report_title}.html")
 
@@ -29,6 +29,7 @@ setup(
     author_email="github@dalbrecht.tech",
     install_requires=[
         "influxdb==5.2.3",
+        "numpy>=1.21",
         "prettytable==0.7.2",
         "plotly==4.5.4",
         "spidev==3.6",